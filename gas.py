@@ -1,13 +1,31 @@
 import threading
+import asyncio
+import multiprocessing
+from multiprocessing import shared_memory
 import serial
+from serial.tools import list_ports
 import time
+import random
+import math
+import struct
+import argparse
+import os
 import pymysql
 import tkinter as tk
 from tkinter import messagebox, ttk
 from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
+from collections import deque, Counter
+from string import Template
 import re
+import sys
+import tracemalloc
+
+try:
+    import psutil  # Opcional: CPU por hilo en Windows
+except ImportError:
+    psutil = None
 
 # =============================
 # CONFIGURACIÓN
@@ -18,7 +36,10 @@ class Config:
     SMTP_PORT = 587
     EMAIL_USER = "CORREO AQUI"
     EMAIL_PASS = "CONTRASEÑA DE APLICACION"  # Configurar contraseña de aplicación
-    MAX_CORREOS = 3
+    MAX_CORREOS = 3  # resúmenes por destinatario dentro de VENTANA_CORREOS (los avisos de apertura y cierre no cuentan)
+    VENTANA_CORREOS = 3600  # segundos para recuperar MAX_CORREOS envíos
+    MAX_CORREOS_RAFAGA = 50  # tope global de correos por alerta
+    LIMITADOR_CHECKPOINT = 30  # segundos entre sincronizaciones con la base de datos
     
     # MySQL
     DB_HOST = "localhost"
@@ -30,20 +51,54 @@ class Config:
     # Serial
     SERIAL_PORT = "COM8" # Cambiar según el sistema
     SERIAL_BAUD = 115200
+    SERIAL_NUMERO_USB = ""  # Si se define, se busca el ESP32 por número de serie USB en lugar de SERIAL_PORT
+    SONDEO_PUERTOS = 0.5  # segundos entre revisiones de puertos disponibles
+    RECONEXION_BASE = 0.05  # espera inicial del backoff exponencial (segundos)
+    RECONEXION_MAX = 0.8  # tope del backoff cuando el puerto está presente (segundos)
+    
+    # Memoria compartida (modo multiproceso)
+    SHM_NOMBRE = "gas_monitor_estado"
+    SHM_MUESTRAS = 1024  # tamaño del anillo de muestras recientes
+    SHM_VIGENCIA = 2.0  # segundos sin publicar antes de considerar caída la ingesta
+    TENDENCIA_MUESTRAS = 200  # muestras del anillo que grafica el monitor
+    
+    # Red (nodos ESP32 por Wi-Fi)
+    RED_HOST = "0.0.0.0"
+    RED_PUERTO_TCP = 5050
+    RED_PUERTO_UDP = 5051
+    RED_MAX_CONEXIONES = 1000
+    RED_LIMITE_BUFFER = 4096  # bytes por conexión antes de dejar de leer del socket
+    RED_TIMEOUT_INACTIVIDAD = 30  # segundos sin datos antes de cerrar la conexión
+    RED_REPORTE = 10  # segundos entre reportes de rendimiento
+    
+    # Diagnóstico (se activa con GAS_DIAGNOSTICO=1, --diagnostico o Ctrl+Shift+D; GAS_PERFILAR=N solo perfila)
+    DIAGNOSTICO_DIR = "diagnostico"
+    DIAGNOSTICO_INTERVALO = 60  # segundos entre reportes automáticos
+    DIAGNOSTICO_MUESTREO = 0.005  # segundos entre muestras del perfilador
+    DIAGNOSTICO_MARCOS = 10  # profundidad de pila guardada por tracemalloc
     
     # Umbrales
     UMBRAL_ANALOGICO = 2000
-    TIEMPO_COOLDOWN = 30  # segundos entre alertas
+    # Un dispositivo que reportó gas sigue en alerta hasta que envíe una lectura normal
+    # o pasen estos segundos sin lecturas suyas (desconexión, cierre o inactividad)
+    VIGENCIA_ALERTA = 60
+    TIEMPO_COOLDOWN = 30  # segundos sin gas para dar por resuelto un incidente
+    VENTANA_REAPERTURA = 600  # si el gas vuelve antes de estos segundos, se reabre el incidente anterior
+    INTERVALO_RESUMEN = 1800  # segundos entre resúmenes; con MAX_CORREOS=3 por hora nunca se agotan
+    REINTENTO_AVISO_BASE = 5  # segundos antes del primer reintento del aviso de apertura
+    REINTENTO_AVISO_MAX = 120  # tope del backoff de reintentos (segundos)
 
 # =============================
 # VARIABLES GLOBALES
 # =============================
 class Estado:
     gas_detectado = False
-    ultima_alerta = 0
     valor_sensor = 0
     ultima_lectura = None
     conectado_serial = False
+    dispositivos_en_alerta = {}  # dispositivo -> hora de su última lectura con gas
+    inicio_desconexion = None
+    desconexiones = deque(maxlen=50)  # duración en segundos de cada desconexión
     lock = threading.Lock()
 
 # =============================
@@ -139,21 +194,68 @@ class BaseDatos:
             conn.close()
 
     @staticmethod
-    def incrementar_envio(user_id):
+    def asegurar_esquema():
+        """Agrega la columna reinicios a bases creadas con el esquema anterior"""
         conn = BaseDatos.conectar()
         if not conn:
-            return
+            return False
         
         try:
             with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE usuarios_alerta 
-                    SET enviados = enviados + 1
-                    WHERE id = %s
-                """, (user_id,))
+                cursor.execute("SHOW COLUMNS FROM usuarios_alerta LIKE 'reinicios'")
+                if not cursor.fetchone():
+                    cursor.execute("ALTER TABLE usuarios_alerta ADD COLUMN reinicios INT DEFAULT 0")
+                    print("[INFO] Columna reinicios agregada a usuarios_alerta")
             conn.commit()
+            return True
         except Exception as e:
-            print(f"[ERROR] Incrementar envío: {e}")
+            print(f"[ERROR] Actualizar esquema: {e}")
+            return False
+        finally:
+            conn.close()
+
+    @staticmethod
+    def obtener_contadores():
+        """Lista (id, correo, enviados, reinicios), o None si falla la consulta"""
+        conn = BaseDatos.conectar()
+        if not conn:
+            return None
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, correo, enviados, reinicios FROM usuarios_alerta")
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"[ERROR] Obtener contadores: {e}")
+            return None
+        finally:
+            conn.close()
+
+    @staticmethod
+    def guardar_enviados(valores):
+        """Guarda en lote {user_id: (enviados, reinicios)}.
+        
+        Solo escribe si reinicios no cambió desde la lectura, para no pisar
+        un reinicio hecho mientras tanto desde otra ventana.
+        """
+        if not valores:
+            return True
+        
+        conn = BaseDatos.conectar()
+        if not conn:
+            return False
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    "UPDATE usuarios_alerta SET enviados = %s WHERE id = %s AND reinicios = %s",
+                    [(enviados, user_id, reinicios) for user_id, (enviados, reinicios) in valores.items()]
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"[ERROR] Guardar envíos: {e}")
+            return False
         finally:
             conn.close()
 
@@ -165,7 +267,8 @@ class BaseDatos:
         
         try:
             with conn.cursor() as cursor:
-                cursor.execute("UPDATE usuarios_alerta SET enviados = 0")
+                # reinicios avisa al limitador de envíos, aunque corra en otro proceso
+                cursor.execute("UPDATE usuarios_alerta SET enviados = 0, reinicios = reinicios + 1")
             conn.commit()
             return True
         except Exception as e:
@@ -181,83 +284,545 @@ class BaseDatos:
         pass
 
 # =============================
-# SISTEMA DE ALERTAS
+# LÍMITE DE ENVÍOS
 # =============================
-class SistemaAlertas:
+class LimitadorEnvios:
+    """Cubetas de tokens por destinatario, mantenidas en memoria.
+    
+    Cada destinatario dispone de MAX_CORREOS envíos que se recuperan de forma
+    continua a lo largo de VENTANA_CORREOS. La columna enviados guarda los
+    tokens consumidos y se sincroniza cada LIMITADOR_CHECKPOINT segundos, lo
+    que también incorpora usuarios nuevos. Cada reinicio incrementa la
+    columna reinicios, así se detecta aunque se haga desde otro proceso.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cubetas = {}  # user_id -> {"correo", "tokens", "actualizado", "reinicios"}
+        self.sincronizado = False
+        self.esquema_revisado = False
+    
+    def recargar(self, cubeta, ahora):
+        """Suma los tokens recuperados desde la última consulta"""
+        tasa = Config.MAX_CORREOS / Config.VENTANA_CORREOS
+        cubeta["tokens"] = min(Config.MAX_CORREOS, cubeta["tokens"] + (ahora - cubeta["actualizado"]) * tasa)
+        cubeta["actualizado"] = ahora
+    
     @staticmethod
-    def enviar_alertas():
-        """Envía alertas por correo con control de cooldown"""
-        tiempo_actual = time.time()
+    def consumidos(cubeta):
+        return math.ceil(Config.MAX_CORREOS - cubeta["tokens"] - 1e-9)
+    
+    def destinatarios(self):
+        """Devuelve [(user_id, correo)] de todos los destinatarios, sin consumir tokens"""
+        if not self.sincronizado:
+            self.sincronizar()
         
-        # Verificar cooldown
-        if tiempo_actual - Estado.ultima_alerta < Config.TIEMPO_COOLDOWN:
-            print("[INFO] Cooldown activo, alerta no enviada")
-            return
+        with self.lock:
+            todos = [(user_id, cubeta["correo"]) for user_id, cubeta in self.cubetas.items()]
+        return todos[:Config.MAX_CORREOS_RAFAGA]
+    
+    def reservar(self):
+        """Devuelve [(user_id, correo)] con un token ya consumido para cada uno"""
+        if not self.sincronizado:
+            self.sincronizar()
         
-        usuarios = BaseDatos.obtener_usuarios()
-        enviados = 0
+        ahora = time.time()
+        reservados = []
         
-        for user_id, correo, enviados_count in usuarios:
-            if enviados_count >= Config.MAX_CORREOS:
-                print(f"[INFO] {correo} alcanzó el límite de envíos")
-                continue
+        with self.lock:
+            for user_id, cubeta in self.cubetas.items():
+                self.recargar(cubeta, ahora)
+                if cubeta["tokens"] < 1:
+                    print(f"[INFO] {cubeta['correo']} alcanzó el límite de envíos")
+                    continue
+                if len(reservados) >= Config.MAX_CORREOS_RAFAGA:
+                    print(f"[INFO] Límite global de {Config.MAX_CORREOS_RAFAGA} correos por alerta alcanzado")
+                    break
+                cubeta["tokens"] -= 1
+                reservados.append((user_id, cubeta["correo"]))
+        
+        return reservados
+    
+    def devolver(self, user_id):
+        """Reintegra el token de un envío fallido"""
+        with self.lock:
+            cubeta = self.cubetas.get(user_id)
+            if cubeta:
+                cubeta["tokens"] = min(Config.MAX_CORREOS, cubeta["tokens"] + 1)
+    
+    def reiniciar(self):
+        """Llena todas las cubetas"""
+        with self.lock:
+            for cubeta in self.cubetas.values():
+                cubeta["tokens"] = Config.MAX_CORREOS
+    
+    def sincronizar(self):
+        """Incorpora cambios de la base de datos y guarda los contadores actuales"""
+        if not self.esquema_revisado:
+            self.esquema_revisado = BaseDatos.asegurar_esquema()
+        
+        usuarios = BaseDatos.obtener_contadores()
+        if usuarios is None:
+            return False
+        
+        ahora = time.time()
+        cambios = {}
+        
+        with self.lock:
+            cubetas = {}
+            for user_id, correo, enviados, reinicios in usuarios:
+                cubeta = self.cubetas.get(user_id)
+                if cubeta is None:
+                    # Usuario nuevo o primer arranque: restaurar lo consumido
+                    cubeta = {
+                        "correo": correo,
+                        "tokens": max(0, Config.MAX_CORREOS - enviados),
+                        "actualizado": ahora,
+                        "reinicios": reinicios,
+                    }
+                elif reinicios != cubeta["reinicios"]:
+                    # Contadores reiniciados desde alguna interfaz
+                    cubeta["tokens"] = Config.MAX_CORREOS
+                    cubeta["reinicios"] = reinicios
+                
+                self.recargar(cubeta, ahora)
+                consumidos = self.consumidos(cubeta)
+                if consumidos != enviados:
+                    cambios[user_id] = (consumidos, reinicios)
+                cubetas[user_id] = cubeta
             
-            if SistemaAlertas.enviar_correo(correo, Estado.valor_sensor):
-                BaseDatos.incrementar_envio(user_id)
-                enviados += 1
+            # Los usuarios eliminados desaparecen al no venir en la consulta
+            self.cubetas = cubetas
+            self.sincronizado = True
         
-        if enviados > 0:
-            Estado.ultima_alerta = tiempo_actual
-            print(f"[✓] {enviados} alertas enviadas")
+        return BaseDatos.guardar_enviados(cambios)
+    
+    def iniciar_sincronizacion(self):
+        """Carga el estado guardado y lo sincroniza periódicamente en un hilo"""
+        self.sincronizar()
+        
+        def bucle():
+            while True:
+                time.sleep(Config.LIMITADOR_CHECKPOINT)
+                self.sincronizar()
         
-        return enviados
+        hilo = threading.Thread(target=bucle, name="limitador-envios", daemon=True)
+        hilo.start()
+        return hilo
+
+# =============================
+# SISTEMA DE ALERTAS
+# =============================
+class Plantillas:
+    """Plantillas de correo compiladas una sola vez: (asunto, cuerpo)"""
+    APERTURA = (
+        Template("⚠ ALERTA DE GAS #$numero - ACCIÓN REQUERIDA"),
+        Template("""⚠️ ALERTA DE DETECCIÓN DE GAS ⚠️
+
+Incidente: #$numero
+Fecha y hora: $inicio
+Valor del sensor: $valor
+Dispositivos: $dispositivos
+
+Se ha detectado una concentración anormal de gas.
+Por favor, tome las precauciones necesarias.
+Recibirá un resumen cada $intervalo mientras continúe y un aviso al resolverse.
+
+---
+Sistema automático de alertas
+""")
+    )
+    RESUMEN = (
+        Template("⚠ GAS #$numero - CONTINÚA ACTIVO ($duracion)"),
+        Template("""⚠️ RESUMEN DE INCIDENTE DE GAS ⚠️
+
+Incidente: #$numero
+Inicio: $inicio
+Duración: $duracion
+Valor actual: $valor
+Valor máximo: $pico
+Detecciones: $detecciones
+Dispositivos: $dispositivos
+
+La concentración de gas sigue siendo anormal.
 
+---
+Sistema automático de alertas
+""")
+    )
+    RESUELTO = (
+        Template("✓ GAS #$numero - INCIDENTE RESUELTO"),
+        Template("""✓ INCIDENTE DE GAS RESUELTO
+
+Incidente: #$numero
+Inicio: $inicio
+Fin: $fin
+Duración: $duracion
+Valor máximo: $pico
+Detecciones: $detecciones
+Dispositivos: $dispositivos
+
+Las lecturas volvieron a la normalidad.
+
+---
+Sistema automático de alertas
+""")
+    )
+    
+    SIN_LECTURAS = (
+        Template("⚠ GAS #$numero - SENSOR SIN LECTURAS, ESTADO DESCONOCIDO"),
+        Template("""⚠️ INCIDENTE DE GAS CERRADO SIN CONFIRMAR ⚠️
+
+Incidente: #$numero
+Inicio: $inicio
+Fin: $fin
+Duración: $duracion
+Valor máximo: $pico
+Detecciones: $detecciones
+Dispositivos: $dispositivos
+Sin lecturas: $perdidos
+
+Estos dispositivos dejaron de enviar lecturas mientras detectaban gas.
+No se pudo confirmar que la concentración volviera a la normalidad.
+Verifique el lugar y el sensor.
+
+---
+Sistema automático de alertas
+""")
+    )
+    
+    REAPERTURA = (
+        Template("⚠ GAS #$numero - REAPARECE ($reaperturas)"),
+        Template("""⚠️ EL GAS VOLVIÓ A DETECTARSE ⚠️
+
+Incidente: #$numero (reabierto $reaperturas veces)
+Inicio: $inicio
+Valor del sensor: $valor
+Valor máximo: $pico
+Dispositivos: $dispositivos
+
+El incidente se había dado por resuelto, pero la concentración de gas
+volvió a ser anormal. Por favor, tome las precauciones necesarias.
+El próximo cierre esperará $espera_cierre sin gas.
+
+---
+Sistema automático de alertas
+""")
+    )
+    
     @staticmethod
-    def enviar_correo(destinatario, valor_sensor):
-        """Envía un correo individual"""
-        if not Config.EMAIL_PASS:
-            print("[ERROR] Contraseña de correo no configurada")
-            return False
+    def renderizar(plantilla, valores):
+        asunto, cuerpo = plantilla
+        return asunto.substitute(valores), cuerpo.substitute(valores)
+
+def formatear_duracion(segundos):
+    """Convierte segundos en texto como '1 h 05 min' o '3 min 20 s'"""
+    minutos, segundos = divmod(int(segundos), 60)
+    horas, minutos = divmod(minutos, 60)
+    if horas:
+        return f"{horas} h {minutos:02d} min"
+    return f"{minutos} min {segundos:02d} s"
+
+class Incidente:
+    """Una detección sostenida, desde el primer flanco hasta que pasa espera_cierre() sin gas"""
+    def __init__(self, numero, inicio):
+        self.numero = numero
+        self.inicio = inicio
+        self.pico = 0
+        self.valor = 0
+        self.detecciones = 0
+        self.dispositivos = set()
+        self.ultima_deteccion = inicio
+        self.ultimo_aviso = inicio
+        self.notificados = set()  # correos que recibieron algún aviso
+        self.perdidos = set()  # dispositivos que dejaron de reportar estando en gas
+        self.reaperturas = 0
+    
+    def espera_cierre(self):
+        """Segundos sin gas para cerrar; se duplica con cada reapertura para frenar la intermitencia"""
+        tope = max(Config.TIEMPO_COOLDOWN, Config.VENTANA_REAPERTURA)
+        return min(tope, Config.TIEMPO_COOLDOWN * 2 ** min(self.reaperturas, 16))
+    
+    def actualizar(self, dispositivo, ao, ahora, flanco):
+        self.valor = ao
+        self.pico = max(self.pico, ao)
+        self.dispositivos.add(dispositivo)
+        self.ultima_deteccion = ahora
+        if flanco:
+            self.detecciones += 1
+    
+    def valores(self, ahora):
+        return {
+            "numero": self.numero,
+            "inicio": datetime.fromtimestamp(self.inicio).strftime("%d/%m/%Y %H:%M:%S"),
+            "fin": datetime.fromtimestamp(ahora).strftime("%d/%m/%Y %H:%M:%S"),
+            "duracion": formatear_duracion(ahora - self.inicio),
+            "intervalo": formatear_duracion(Config.INTERVALO_RESUMEN),
+            "valor": self.valor,
+            "pico": self.pico,
+            "detecciones": self.detecciones,
+            "dispositivos": ", ".join(sorted(str(d) for d in self.dispositivos)),
+            "perdidos": ", ".join(sorted(str(d) for d in self.perdidos)),
+            "reaperturas": self.reaperturas,
+            "espera_cierre": formatear_duracion(self.espera_cierre()),
+        }
+
+class AgregadorIncidentes:
+    """Agrupa las detecciones en incidentes: un aviso al abrir, resúmenes periódicos y uno al resolver.
+    
+    Los avisos de apertura y reapertura nunca pasan por el limitador de envíos.
+    La intermitencia se frena reabriendo el incidente anterior y alargando su
+    espera de cierre, no suprimiendo avisos.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.incidente = None
+        self.ultimo_cerrado = None  # (incidente, hora de cierre)
+        self.contador = 0
+    
+    def registrar(self, dispositivo, ao, flanco):
+        """Registra una lectura con gas; abre o reabre un incidente si no hay uno en curso"""
+        ahora = time.time()
+        aviso = None
         
-        try:
-            fecha = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        with self.lock:
+            incidente = self.incidente
+            if incidente is None:
+                if self.ultimo_cerrado and ahora - self.ultimo_cerrado[1] < Config.VENTANA_REAPERTURA:
+                    incidente = self.incidente = self.ultimo_cerrado[0]
+                    incidente.reaperturas += 1
+                    incidente.ultimo_aviso = ahora
+                    incidente.actualizar(dispositivo, ao, ahora, flanco)
+                    aviso = Plantillas.renderizar(Plantillas.REAPERTURA, incidente.valores(ahora))
+                else:
+                    self.contador += 1
+                    incidente = self.incidente = Incidente(self.contador, ahora)
+                    incidente.actualizar(dispositivo, ao, ahora, flanco)
+                    aviso = Plantillas.renderizar(Plantillas.APERTURA, incidente.valores(ahora))
+                self.ultimo_cerrado = None
+            else:
+                incidente.actualizar(dispositivo, ao, ahora, flanco)
+            incidente.perdidos.discard(dispositivo)
+        
+        if aviso:
+            estado = f"reabierto ({incidente.reaperturas})" if incidente.reaperturas else "abierto"
+            print(f"[ALERTA] Incidente #{incidente.numero} {estado}")
+            hilo = threading.Thread(
+                target=self.avisar_apertura,
+                args=(incidente, incidente.reaperturas, *aviso),
+                name=f"aviso-incidente-{incidente.numero}",
+                daemon=True
+            )
+            hilo.start()
+    
+    def registrar_normal(self, dispositivo):
+        """Una lectura normal de un dispositivo que había dejado de reportar confirma su estado"""
+        incidente = self.incidente
+        if incidente is None or not incidente.perdidos:
+            return
+        with self.lock:
+            incidente.perdidos.discard(dispositivo)
+    
+    def marcar_sin_lecturas(self, dispositivos):
+        """Anota los dispositivos que dejaron de reportar mientras detectaban gas"""
+        with self.lock:
+            if self.incidente is not None:
+                self.incidente.perdidos.update(dispositivos)
+    
+    def revisar(self):
+        """Envía el resumen pendiente o cierra el incidente si el gas desapareció"""
+        with Estado.lock:
+            gas = Estado.gas_detectado
+        
+        ahora = time.time()
+        resumen = None
+        resuelto = None
+        
+        with self.lock:
+            incidente = self.incidente
+            if incidente is None:
+                return
             
-            cuerpo = f"""
-            ⚠️ ALERTA DE DETECCIÓN DE GAS ⚠️
+            if not gas and ahora - incidente.ultima_deteccion >= incidente.espera_cierre():
+                self.incidente = None
+                self.ultimo_cerrado = (incidente, ahora)
+                # Sin lecturas no es lo mismo que volver a la normalidad
+                plantilla = Plantillas.SIN_LECTURAS if incidente.perdidos else Plantillas.RESUELTO
+                resuelto = Plantillas.renderizar(plantilla, incidente.valores(ahora))
+            elif ahora - incidente.ultimo_aviso >= Config.INTERVALO_RESUMEN:
+                incidente.ultimo_aviso = ahora
+                resumen = Plantillas.renderizar(Plantillas.RESUMEN, incidente.valores(ahora))
+        
+        if resumen:
+            # Los resúmenes son lo menos urgente: son lo único que consume tokens
+            reservados = SistemaAlertas.limitador.reservar()
+            aceptados = SistemaAlertas.enviar_mensaje(*resumen, [correo for _, correo in reservados])
+            for user_id, correo in reservados:
+                if correo not in aceptados:
+                    SistemaAlertas.limitador.devolver(user_id)
+            with self.lock:
+                incidente.notificados.update(aceptados)
+        elif resuelto:
+            if incidente.perdidos:
+                print(f"[ALERTA] Incidente #{incidente.numero} cerrado sin lecturas de {', '.join(sorted(incidente.perdidos))}")
+            else:
+                print(f"[INFO] Incidente #{incidente.numero} resuelto")
+            # Solo a quienes fueron avisados, sin consumir su límite de envíos
+            SistemaAlertas.enviar_mensaje(*resuelto, sorted(incidente.notificados))
+    
+    def avisar_apertura(self, incidente, reapertura, asunto, cuerpo):
+        """Envía el aviso de apertura (sin límite de envíos) y reintenta con backoff
+        hasta que todos lo reciban o el incidente se cierre o se reabra"""
+        espera = Config.REINTENTO_AVISO_BASE
+        recibido = set()
+        
+        while True:
+            with self.lock:
+                if self.incidente is not incidente or incidente.reaperturas != reapertura:
+                    return
             
-            Fecha y hora: {fecha}
-            Valor del sensor: {valor_sensor}
-            Dispositivo: ESP32 + MQ2
+            todos = {correo for _, correo in SistemaAlertas.limitador.destinatarios()}
+            pendientes = sorted(todos - recibido)
+            aceptados = SistemaAlertas.enviar_mensaje(asunto, cuerpo, pendientes)
+            recibido.update(aceptados)
             
-            Se ha detectado una concentración anormal de gas.
-            Por favor, tome las precauciones necesarias.
+            with self.lock:
+                incidente.notificados.update(aceptados)
             
-            ---
-            Sistema automático de alertas
-            """
+            if todos and todos <= recibido:
+                return
             
+            print(f"[INFO] Aviso del incidente #{incidente.numero} pendiente, reintentando en {espera}s")
+            time.sleep(espera)
+            espera = min(espera * 2, Config.REINTENTO_AVISO_MAX)
+    
+    def iniciar(self):
+        """Revisa alertas vencidas e incidentes abiertos cada segundo en un hilo"""
+        def bucle():
+            while True:
+                time.sleep(1)
+                try:
+                    Deteccion.expirar_alertas()
+                    self.revisar()
+                except Exception as e:
+                    print(f"[ERROR] Revisar incidentes: {e}")
+        
+        hilo = threading.Thread(target=bucle, name="incidentes", daemon=True)
+        hilo.start()
+        return hilo
+
+class SistemaAlertas:
+    limitador = LimitadorEnvios()
+    agregador = AgregadorIncidentes()
+    
+    @staticmethod
+    def iniciar():
+        """Carga los límites de envío y arranca los hilos de sincronización e incidentes"""
+        SistemaAlertas.limitador.iniciar_sincronizacion()
+        SistemaAlertas.agregador.iniciar()
+    
+    @staticmethod
+    def enviar_mensaje(asunto, cuerpo, destinatarios):
+        """Envía un mismo correo a varios destinatarios (copia oculta) en una sola sesión SMTP"""
+        if not destinatarios:
+            return set()
+        
+        if not Config.EMAIL_PASS:
+            print("[ERROR] Contraseña de correo no configurada")
+            return set()
+        
+        try:
             msg = MIMEText(cuerpo)
-            msg["Subject"] = "⚠ ALERTA DE GAS - ACCIÓN REQUERIDA"
+            msg["Subject"] = asunto
             msg["From"] = Config.EMAIL_USER
-            msg["To"] = destinatario
+            msg["To"] = Config.EMAIL_USER
             
             with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT, timeout=10) as server:
                 server.starttls()
                 server.login(Config.EMAIL_USER, Config.EMAIL_PASS)
-                server.sendmail(Config.EMAIL_USER, destinatario, msg.as_string())
-            
-            print(f"[✓] Correo enviado a {destinatario}")
-            return True
+                rechazados = server.sendmail(Config.EMAIL_USER, destinatarios, msg.as_string())
             
         except Exception as e:
-            print(f"[ERROR] Envío fallido a {destinatario}: {e}")
-            return False
+            print(f"[ERROR] Envío fallido de '{asunto}': {e}")
+            return set()
+        
+        aceptados = set(destinatarios) - set(rechazados)
+        for correo in rechazados:
+            print(f"[ERROR] Envío fallido a {correo}")
+        
+        print(f"[✓] '{asunto}' enviado a {len(aceptados)} destinatarios")
+        return aceptados
 
+# =============================
+# DETECCIÓN
+# =============================
+class Deteccion:
     @staticmethod
-    def enviar_alerta_async():
-        """Envía alertas en un hilo separado"""
-        hilo = threading.Thread(target=SistemaAlertas.enviar_alertas, daemon=True)
-        hilo.start()
+    def parsear_linea(linea):
+        """Convierte 'ID: nodo1 | AO: 1332 | DO: 1' en (id, ao, do); el ID es opcional"""
+        if "AO:" not in linea or "DO:" not in linea:
+            return None
+        
+        campos = {}
+        for parte in linea.split("|"):
+            clave, _, valor = parte.partition(":")
+            campos[clave.strip()] = valor.strip()
+        return campos.get("ID"), int(campos["AO"]), int(campos["DO"])
+    
+    @staticmethod
+    def procesar_muestra(dispositivo, ao, do, publicador=None):
+        """Actualiza el estado con una lectura y dispara la alerta en el flanco de subida"""
+        nueva_alerta = False
+        gas = do == 1 or ao > Config.UMBRAL_ANALOGICO
+        
+        with Estado.lock:
+            Estado.valor_sensor = ao
+            Estado.ultima_lectura = datetime.now()
+            
+            # Detectar gas: basta con que un dispositivo lo detecte
+            if gas:
+                Estado.dispositivos_en_alerta[dispositivo] = time.time()
+            else:
+                Estado.dispositivos_en_alerta.pop(dispositivo, None)
+            
+            if Estado.dispositivos_en_alerta:
+                if not Estado.gas_detectado:
+                    Estado.gas_detectado = True
+                    nueva_alerta = True
+            else:
+                Estado.gas_detectado = False
+        
+        if nueva_alerta:
+            BaseDatos.registrar_evento("GAS_DETECTADO", ao)
+        if gas:
+            SistemaAlertas.agregador.registrar(dispositivo, ao, nueva_alerta)
+        else:
+            SistemaAlertas.agregador.registrar_normal(dispositivo)
+        
+        if publicador:
+            publicador.publicar((time.time(), ao, do))
+    
+    @staticmethod
+    def expirar_alertas():
+        """Retira los dispositivos en alerta que dejaron de enviar lecturas.
+        
+        Por seguridad, desconectarse no borra la alerta de inmediato: se
+        mantiene VIGENCIA_ALERTA segundos desde la última lectura con gas. Al
+        vencer, el incidente lo registra como "sin lecturas" y no se da por
+        resuelto con normalidad.
+        """
+        limite = time.time() - Config.VIGENCIA_ALERTA
+        
+        with Estado.lock:
+            vencidos = [d for d, ultima in Estado.dispositivos_en_alerta.items() if ultima < limite]
+            for dispositivo in vencidos:
+                del Estado.dispositivos_en_alerta[dispositivo]
+            if vencidos and not Estado.dispositivos_en_alerta:
+                Estado.gas_detectado = False
+        
+        for dispositivo in vencidos:
+            print(f"[ALERTA] {dispositivo} sin lecturas en {Config.VIGENCIA_ALERTA}s, alerta retirada")
+        if vencidos:
+            SistemaAlertas.agregador.marcar_sin_lecturas(vencidos)
 
 # =============================
 # LECTURA SERIAL
@@ -267,18 +832,64 @@ class LectorSerial:
         self.serial = None
         self.buffer = ""
         self.intentos_reconexion = 0
+        self.puerto_actual = None
+        self.puerto_ausente = False
+        self.ultima_verificacion = 0
+        self.publicador = None  # EstadoCompartido en modo multiproceso
+    
+    def buscar_puerto(self):
+        """Devuelve el puerto del ESP32 si está disponible, o None"""
+        if not Config.SERIAL_NUMERO_USB and "://" in Config.SERIAL_PORT:
+            # URLs de pyserial (socket://, rfc2217://) no se enumeran: se abren directamente
+            return Config.SERIAL_PORT
+        
+        try:
+            puertos = list_ports.comports(include_links=True)
+        except Exception as e:
+            print(f"[ERROR] Listar puertos: {e}")
+            return None if Config.SERIAL_NUMERO_USB else Config.SERIAL_PORT
+        
+        if Config.SERIAL_NUMERO_USB:
+            # include_links lista el tty y sus enlaces by-id con el mismo número de serie:
+            # devolver siempre la ruta real para que verificar_puerto compare lo mismo
+            encontrados = sorted({
+                os.path.realpath(puerto.device) if os.name == "posix" else puerto.device
+                for puerto in puertos
+                if puerto.serial_number == Config.SERIAL_NUMERO_USB
+            })
+            return encontrados[0] if encontrados else None
         
-    def conectar(self):
+        if os.name == "posix":
+            # Enlaces estables (/dev/serial/by-id/...) y puertos que no se enumeran (/dev/ttyS*, pty)
+            real = os.path.realpath(Config.SERIAL_PORT)
+            for puerto in puertos:
+                if puerto.device == Config.SERIAL_PORT or os.path.realpath(puerto.device) == real:
+                    return Config.SERIAL_PORT
+            return Config.SERIAL_PORT if os.path.exists(Config.SERIAL_PORT) else None
+        
+        for puerto in puertos:
+            if puerto.device == Config.SERIAL_PORT:
+                return Config.SERIAL_PORT
+        return None
+        
+    def conectar(self, puerto=None):
         """Intenta conectar con el ESP32"""
+        puerto = puerto or self.buscar_puerto()
+        if puerto is None:
+            Estado.conectado_serial = False
+            return False
+        
         try:
             self.serial = serial.Serial(
-                Config.SERIAL_PORT, 
+                puerto, 
                 Config.SERIAL_BAUD, 
                 timeout=0.1
             )
+            self.puerto_actual = puerto
             Estado.conectado_serial = True
-            print(f"[✓] ESP32 conectado en {Config.SERIAL_PORT}")
+            print(f"[✓] ESP32 conectado en {puerto}")
             self.intentos_reconexion = 0
+            self.registrar_reconexion()
             return True
         except Exception as e:
             Estado.conectado_serial = False
@@ -286,38 +897,65 @@ class LectorSerial:
             return False
     
     def reconectar(self):
-        """Intenta reconectar después de pérdida de conexión"""
-        if self.intentos_reconexion < 5:
-            self.intentos_reconexion += 1
-            print(f"[INFO] Intentando reconectar ({self.intentos_reconexion}/5)...")
-            time.sleep(2)
-            return self.conectar()
-        return False
+        """Espera a que el puerto reaparezca y reintenta con backoff exponencial"""
+        puerto = self.buscar_puerto()
+        if puerto is None:
+            if not self.puerto_ausente:
+                print("[INFO] Puerto del ESP32 no disponible, esperando a que se conecte...")
+                self.puerto_ausente = True
+            self.intentos_reconexion = 0
+            time.sleep(Config.SONDEO_PUERTOS)
+            return False
+        
+        self.puerto_ausente = False
+        # Exponente acotado: un puerto listado que no abre reintenta indefinidamente
+        espera = min(Config.RECONEXION_MAX, Config.RECONEXION_BASE * (2 ** min(self.intentos_reconexion, 10)))
+        espera = random.uniform(espera / 2, espera)
+        self.intentos_reconexion += 1
+        print(f"[INFO] Intentando reconectar a {puerto} ({self.intentos_reconexion}) en {espera:.2f}s...")
+        time.sleep(espera)
+        return self.conectar(puerto)
+    
+    def desconectar(self):
+        """Cierra el puerto y marca el inicio de la desconexión"""
+        Estado.conectado_serial = False
+        with Estado.lock:
+            if Estado.inicio_desconexion is None:
+                Estado.inicio_desconexion = time.time()
+        if self.serial:
+            try:
+                self.serial.close()
+            except Exception:
+                pass
+            self.serial = None
+    
+    def registrar_reconexion(self):
+        """Registra cuánto duró la desconexión que acaba de terminar"""
+        with Estado.lock:
+            if Estado.inicio_desconexion is None:
+                return
+            duracion = time.time() - Estado.inicio_desconexion
+            Estado.desconexiones.append(duracion)
+            Estado.inicio_desconexion = None
+        print(f"[INFO] Desconexión serial duró {duracion:.2f}s")
+    
+    def verificar_puerto(self):
+        """Detecta si el dispositivo fue desconectado aunque no haya error de lectura"""
+        ahora = time.time()
+        if ahora - self.ultima_verificacion < Config.SONDEO_PUERTOS:
+            return True
+        self.ultima_verificacion = ahora
+        return self.buscar_puerto() == self.puerto_actual
     
     def procesar_linea(self, linea):
         """Procesa una línea recibida del ESP32"""
         try:
-            # Formato: AO: 1332 | DO: 1
-            if "AO:" in linea and "DO:" in linea:
-                partes = linea.split("|")
-                ao = int(partes[0].split("AO:")[1].strip())
-                do = int(partes[1].split("DO:")[1].strip())
-                
-                with Estado.lock:
-                    Estado.valor_sensor = ao
-                    Estado.ultima_lectura = datetime.now()
-                
-                # Detectar gas
-                if do == 1 or ao > Config.UMBRAL_ANALOGICO:
-                    with Estado.lock:
-                        if not Estado.gas_detectado:
-                            Estado.gas_detectado = True
-                            BaseDatos.registrar_evento("GAS_DETECTADO", ao)
-                            SistemaAlertas.enviar_alerta_async()
-                else:
-                    with Estado.lock:
-                        Estado.gas_detectado = False
-                        
+            lectura = Deteccion.parsear_linea(linea)
+            if lectura:
+                _, ao, do = lectura
+                # ID estable: el puerto puede cambiar (COM8 -> COM9) al reconectar
+                dispositivo = Config.SERIAL_NUMERO_USB or "serial"
+                Deteccion.procesar_muestra(dispositivo, ao, do, self.publicador)
         except Exception as e:
             print(f"[ERROR] Procesar línea: {e}")
     
@@ -325,8 +963,13 @@ class LectorSerial:
         """Bucle principal de lectura serial"""
         while True:
             if not Estado.conectado_serial:
-                if not self.reconectar():
-                    time.sleep(5)
+                try:
+                    if not self.reconectar():
+                        continue
+                except Exception as e:
+                    # Ningún error de reconexión debe terminar el hilo del sensor
+                    print(f"[ERROR] Reconexión serial: {e}")
+                    time.sleep(Config.SONDEO_PUERTOS)
                     continue
             
             try:
@@ -341,33 +984,743 @@ class LectorSerial:
                         if linea:
                             print(f"[ESP32] {linea}")
                             self.procesar_linea(linea)
+                elif not self.verificar_puerto():
+                    print(f"[ERROR] Puerto {self.puerto_actual} retirado")
+                    self.desconectar()
+                    continue
                 
                 time.sleep(0.01)
                 
-            except serial.SerialException:
+            except (serial.SerialException, OSError):
                 print("[ERROR] Conexión serial perdida")
-                Estado.conectado_serial = False
-                if self.serial:
-                    self.serial.close()
-                    self.serial = None
+                self.desconectar()
             except Exception as e:
                 print(f"[ERROR] Lectura serial: {e}")
                 time.sleep(0.1)
 
+# =============================
+# SERVIDOR DE RED
+# =============================
+class ProtocoloDatagramas(asyncio.DatagramProtocol):
+    """Recibe lotes UDP: varias líneas por datagrama, con una línea 'ID: nodo' opcional al inicio"""
+    def __init__(self, servidor):
+        self.servidor = servidor
+    
+    def datagram_received(self, data, addr):
+        dispositivo = addr[0]
+        for linea in data.decode(errors="ignore").splitlines():
+            linea = linea.strip()
+            if linea.startswith("ID:") and "AO:" not in linea:
+                dispositivo = linea[3:].strip()
+                continue
+            self.servidor.procesar_linea(linea, dispositivo)
+
+class ServidorIngesta:
+    """Recibe lecturas de nodos ESP32 por TCP (una línea por lectura) y UDP (lotes)"""
+    def __init__(self, host=None, puerto_tcp=None, puerto_udp=None):
+        self.host = host or Config.RED_HOST
+        self.puerto_tcp = puerto_tcp or Config.RED_PUERTO_TCP
+        self.puerto_udp = puerto_udp or Config.RED_PUERTO_UDP
+        self.publicador = None  # EstadoCompartido en modo multiproceso
+        self.conexiones = 0
+        self.muestras = 0
+        self.descartadas = 0
+    
+    def procesar_linea(self, linea, dispositivo):
+        """Envía una línea al mismo flujo de detección y alertas que el lector serial"""
+        if not linea:
+            return
+        try:
+            lectura = Deteccion.parsear_linea(linea)
+            if lectura:
+                id_nodo, ao, do = lectura
+                # Prefijo propio: un nodo de red no puede hacerse pasar por el sensor serial
+                Deteccion.procesar_muestra(f"red:{id_nodo or dispositivo}", ao, do, self.publicador)
+                self.muestras += 1
+        except Exception:
+            self.descartadas += 1
+    
+    async def atender_cliente(self, reader, writer):
+        """Atiende una conexión TCP hasta que se cierre o quede inactiva"""
+        dispositivo = writer.get_extra_info("peername")[0]
+        
+        if self.conexiones >= Config.RED_MAX_CONEXIONES:
+            print(f"[RED] Conexión de {dispositivo} rechazada: límite alcanzado")
+            writer.close()
+            return
+        
+        self.conexiones += 1
+        try:
+            lineas = 0
+            while True:
+                # Si no se lee, el buffer del StreamReader se llena y el socket deja de
+                # recibir: la contrapresión llega al nodo a través de TCP
+                try:
+                    linea = await asyncio.wait_for(reader.readline(), Config.RED_TIMEOUT_INACTIVIDAD)
+                except asyncio.TimeoutError:
+                    print(f"[RED] {dispositivo} inactivo, cerrando conexión")
+                    break
+                except ValueError:
+                    print(f"[RED] {dispositivo} envió una línea demasiado larga, cerrando conexión")
+                    break
+                
+                if not linea:
+                    break
+                
+                linea = linea.decode(errors="ignore").strip()
+                if linea == "CONTADOR":
+                    # Consulta del generador de carga: muestras procesadas hasta ahora
+                    writer.write(f"{self.muestras}\n".encode())
+                    await writer.drain()
+                    continue
+                
+                self.procesar_linea(linea, dispositivo)
+                
+                # readline no cede el control si ya hay datos: evitar que un nodo acapare el bucle
+                lineas += 1
+                if lineas % 64 == 0:
+                    await asyncio.sleep(0)
+        except ConnectionError:
+            pass
+        finally:
+            self.conexiones -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+    
+    async def reportar_rendimiento(self):
+        """Imprime muestras por segundo periódicamente"""
+        anteriores = self.muestras
+        while True:
+            await asyncio.sleep(Config.RED_REPORTE)
+            actuales = self.muestras
+            if actuales != anteriores:
+                tasa = (actuales - anteriores) / Config.RED_REPORTE
+                print(f"[RED] {tasa:.0f} muestras/s | {self.conexiones} conexiones | {self.descartadas} descartadas")
+            anteriores = actuales
+    
+    async def servir(self):
+        """Abre los puertos TCP y UDP y atiende indefinidamente"""
+        servidor = await asyncio.start_server(
+            self.atender_cliente,
+            self.host,
+            self.puerto_tcp,
+            limit=Config.RED_LIMITE_BUFFER
+        )
+        loop = asyncio.get_running_loop()
+        transporte, _ = await loop.create_datagram_endpoint(
+            lambda: ProtocoloDatagramas(self),
+            local_addr=(self.host, self.puerto_udp)
+        )
+        print(f"[✓] Servidor de red en {self.host} (TCP {self.puerto_tcp}, UDP {self.puerto_udp})")
+        
+        try:
+            async with servidor:
+                await self.reportar_rendimiento()
+        finally:
+            transporte.close()
+    
+    def iniciar_en_hilo(self):
+        """Ejecuta el servidor en su propio bucle asyncio dentro de un hilo"""
+        def ejecutar():
+            try:
+                asyncio.run(self.servir())
+            except Exception as e:
+                print(f"[ERROR] Servidor de red: {e}")
+        
+        hilo = threading.Thread(target=ejecutar, name="servidor-red", daemon=True)
+        hilo.start()
+        return hilo
+
+class GeneradorCarga:
+    """Simula muchos nodos ESP32 contra el servidor de red para medir muestras/s.
+    
+    La tasa reportada sale del contador del servidor (muestras realmente
+    procesadas), no de lo escrito en los sockets. Con intervalo=0 cada nodo
+    envía tan rápido como el servidor lo admite, para medir la tasa máxima.
+    """
+    def __init__(self, nodos, duracion=10, intervalo=0.05, host="127.0.0.1", udp=False, lote=10):
+        self.nodos = nodos
+        self.duracion = duracion
+        self.intervalo = intervalo
+        self.host = host
+        self.udp = udp
+        self.lote = lote
+        self.enviadas = 0
+    
+    @staticmethod
+    def linea(nodo):
+        # Valores bajo el umbral para no disparar alertas reales
+        return f"ID: carga-{nodo} | AO: {random.randint(200, 1500)} | DO: 0\n"
+    
+    async def nodo_tcp(self, nodo, fin):
+        loop = asyncio.get_running_loop()
+        _, writer = await asyncio.open_connection(self.host, Config.RED_PUERTO_TCP)
+        try:
+            while loop.time() < fin:
+                writer.write(self.linea(nodo).encode())
+                await writer.drain()
+                self.enviadas += 1
+                await asyncio.sleep(self.intervalo)
+        finally:
+            writer.close()
+    
+    async def nodo_udp(self, nodo, fin):
+        loop = asyncio.get_running_loop()
+        transporte, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol,
+            remote_addr=(self.host, Config.RED_PUERTO_UDP)
+        )
+        try:
+            while loop.time() < fin:
+                datos = "".join(self.linea(nodo) for _ in range(self.lote))
+                transporte.sendto(datos.encode())
+                self.enviadas += self.lote
+                await asyncio.sleep(self.intervalo * self.lote)
+        finally:
+            transporte.close()
+    
+    async def contador_servidor(self):
+        """Pregunta al servidor cuántas muestras lleva procesadas"""
+        reader, writer = await asyncio.open_connection(self.host, Config.RED_PUERTO_TCP)
+        try:
+            writer.write(b"CONTADOR\n")
+            await writer.drain()
+            return int(await asyncio.wait_for(reader.readline(), 5))
+        finally:
+            writer.close()
+    
+    async def ejecutar_async(self):
+        loop = asyncio.get_running_loop()
+        base = await self.contador_servidor()
+        inicio = loop.time()
+        fin = inicio + self.duracion
+        nodo = self.nodo_udp if self.udp else self.nodo_tcp
+        
+        resultados = await asyncio.gather(
+            *(nodo(n, fin) for n in range(self.nodos)),
+            return_exceptions=True
+        )
+        fallidos = sum(1 for r in resultados if isinstance(r, Exception))
+        
+        # Esperar a que el servidor termine de procesar lo que quedó en sus buffers
+        procesadas = await self.contador_servidor()
+        ultimo_cambio = loop.time()
+        while loop.time() - ultimo_cambio < 1:
+            await asyncio.sleep(0.2)
+            actual = await self.contador_servidor()
+            if actual != procesadas:
+                procesadas = actual
+                ultimo_cambio = loop.time()
+        
+        procesadas -= base
+        transcurrido = ultimo_cambio - inicio
+        print(f"[CARGA] {self.nodos} nodos ({'UDP' if self.udp else 'TCP'}), {fallidos} fallidos")
+        # El contador del servidor incluye lecturas de nodos reales conectados durante la prueba
+        print(f"[CARGA] Enviadas {self.enviadas}, procesadas por el servidor {procesadas} "
+              f"({max(0, self.enviadas - procesadas)} sin procesar)")
+        print(f"[CARGA] {procesadas} muestras en {transcurrido:.1f}s = {procesadas / transcurrido:.0f} muestras/s procesadas")
+    
+    def ejecutar(self):
+        try:
+            asyncio.run(self.ejecutar_async())
+        except OSError as e:
+            print(f"[ERROR] No se pudo conectar al servidor de red en {self.host}:{Config.RED_PUERTO_TCP}: {e}")
+            print("[ERROR] ¿Se inició el sistema con --red?")
+        except (asyncio.TimeoutError, ValueError):
+            print(f"[ERROR] El servidor en {self.host}:{Config.RED_PUERTO_TCP} no respondió a CONTADOR")
+
+# =============================
+# ESTADO COMPARTIDO ENTRE PROCESOS
+# =============================
+class EstadoCompartido:
+    """Estado en vivo y anillo de muestras recientes en memoria compartida.
+    
+    Solo el proceso de ingesta escribe, protegido por un seqlock: el
+    contador de secuencia es impar durante una escritura y los lectores
+    reintentan si cambió mientras leían, sin bloquear nunca al escritor.
+    """
+    # seq, capacidad, valor, gas, conectado, ultima_lectura, actualizado, total_muestras
+    CABECERA = struct.Struct("<QIiBB6xddQ")
+    # timestamp, AO, DO
+    MUESTRA = struct.Struct("<dii")
+    SEQ = struct.Struct("<Q")
+    MAX_REINTENTOS = 100
+    
+    def __init__(self, shm, escritor):
+        self.shm = shm
+        self.escritor = escritor
+        self.capacidad = 0
+        self._seq = 0
+        self._total = 0
+        self._lock_escritura = threading.Lock()
+    
+    @classmethod
+    def crear(cls, nombre=None, capacidad=None):
+        """Crea el segmento compartido (proceso de ingesta)"""
+        nombre = nombre or Config.SHM_NOMBRE
+        capacidad = capacidad or Config.SHM_MUESTRAS
+        tamano = cls.CABECERA.size + capacidad * cls.MUESTRA.size
+        
+        try:
+            shm = shared_memory.SharedMemory(name=nombre, create=True, size=tamano)
+        except FileExistsError:
+            if cls.en_uso(nombre):
+                print(f"[ERROR] Ya hay una ingesta publicando en '{nombre}'")
+                return None
+            
+            # Segmento huérfano de una ejecución anterior
+            anterior = shared_memory.SharedMemory(name=nombre)
+            anterior.close()
+            anterior.unlink()
+            shm = shared_memory.SharedMemory(name=nombre, create=True, size=tamano)
+        
+        compartido = cls(shm, escritor=True)
+        compartido.capacidad = capacidad
+        compartido.publicar()
+        print(f"[✓] Estado compartido publicado en '{nombre}'")
+        return compartido
+    
+    @classmethod
+    def adjuntar(cls, nombre=None, rastrear=True, espera=5.0):
+        """Se conecta como lector al segmento creado por la ingesta"""
+        nombre = nombre or Config.SHM_NOMBRE
+        limite = time.time() + espera
+        
+        while True:
+            try:
+                if rastrear:
+                    shm = shared_memory.SharedMemory(name=nombre)
+                else:
+                    shm = cls._adjuntar_sin_rastreo(nombre)
+                break
+            except FileNotFoundError:
+                if time.time() >= limite:
+                    print(f"[ERROR] No existe el estado compartido '{nombre}'")
+                    return None
+                time.sleep(0.1)
+        
+        compartido = cls(shm, escritor=False)
+        print(f"[✓] Conectado al estado compartido '{nombre}'")
+        return compartido
+    
+    @classmethod
+    def en_uso(cls, nombre=None):
+        """Indica si un escritor vivo está publicando en el segmento (latido reciente)"""
+        nombre = nombre or Config.SHM_NOMBRE
+        try:
+            shm = cls._adjuntar_sin_rastreo(nombre)
+        except FileNotFoundError:
+            return False
+        
+        try:
+            datos = cls(shm, escritor=False).leer()
+            return datos is not None and time.time() - datos["actualizado"] < Config.SHM_VIGENCIA
+        finally:
+            shm.close()
+    
+    @staticmethod
+    def _adjuntar_sin_rastreo(nombre):
+        """Evita que el resource_tracker borre el segmento al cerrar un monitor independiente"""
+        try:
+            return shared_memory.SharedMemory(name=nombre, track=False)
+        except TypeError:
+            # Python < 3.13
+            shm = shared_memory.SharedMemory(name=nombre)
+            if os.name == "posix":
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+    
+    def publicar(self, muestra=None):
+        """Escribe el estado actual y, opcionalmente, una muestra (timestamp, AO, DO)"""
+        with Estado.lock:
+            gas = Estado.gas_detectado
+            conectado = Estado.conectado_serial
+            valor = Estado.valor_sensor
+            ultima = Estado.ultima_lectura.timestamp() if Estado.ultima_lectura else 0.0
+        
+        buf = self.shm.buf
+        with self._lock_escritura:
+            self._seq += 1
+            self.SEQ.pack_into(buf, 0, self._seq)
+            
+            if muestra is not None:
+                indice = self._total % self.capacidad
+                self.MUESTRA.pack_into(buf, self.CABECERA.size + indice * self.MUESTRA.size, *muestra)
+                self._total += 1
+            
+            self.CABECERA.pack_into(
+                buf, 0, self._seq, self.capacidad, valor, gas, conectado,
+                ultima, time.time(), self._total
+            )
+            
+            self._seq += 1
+            self.SEQ.pack_into(buf, 0, self._seq)
+    
+    def _leer_consistente(self, lectura):
+        """Ejecuta una lectura hasta obtener una copia sin escrituras concurrentes"""
+        buf = self.shm.buf
+        for _ in range(self.MAX_REINTENTOS):
+            seq = self.SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                continue
+            resultado = lectura(buf)
+            if self.SEQ.unpack_from(buf, 0)[0] == seq:
+                return resultado
+        return None
+    
+    def leer(self):
+        """Devuelve una copia consistente del estado, o None si el escritor quedó a medias"""
+        def lectura(buf):
+            _, capacidad, valor, gas, conectado, ultima, actualizado, total = self.CABECERA.unpack_from(buf, 0)
+            return {
+                "capacidad": capacidad,
+                "valor_sensor": valor,
+                "gas_detectado": bool(gas),
+                "conectado_serial": bool(conectado),
+                "ultima_lectura": datetime.fromtimestamp(ultima) if ultima else None,
+                "actualizado": actualizado,
+                "total_muestras": total,
+            }
+        return self._leer_consistente(lectura)
+    
+    def muestras_recientes(self, cantidad=None):
+        """Devuelve las últimas muestras (timestamp, AO, DO), de la más antigua a la más nueva"""
+        def lectura(buf):
+            _, capacidad, *_, total = self.CABECERA.unpack_from(buf, 0)
+            n = min(total, capacidad, cantidad or capacidad)
+            return [
+                self.MUESTRA.unpack_from(buf, self.CABECERA.size + (i % capacidad) * self.MUESTRA.size)
+                for i in range(total - n, total)
+            ]
+        return self._leer_consistente(lectura) or []
+    
+    def volcar_en_estado(self):
+        """Copia el estado compartido al Estado local (procesos de interfaz)"""
+        datos = self.leer()
+        vigente = datos is not None and time.time() - datos["actualizado"] < Config.SHM_VIGENCIA
+        
+        with Estado.lock:
+            if datos:
+                Estado.gas_detectado = datos["gas_detectado"]
+                Estado.valor_sensor = datos["valor_sensor"]
+                Estado.ultima_lectura = datos["ultima_lectura"]
+            Estado.conectado_serial = vigente and datos["conectado_serial"]
+    
+    def cerrar(self):
+        """Libera el segmento; el escritor además lo elimina"""
+        self.shm.close()
+        if self.escritor:
+            self.shm.unlink()
+
+def proceso_ingesta(detener=None, red=False):
+    """Ejecuta lectura, detección y alertas sin interfaz, publicando el estado en memoria compartida"""
+    Diagnostico.iniciar_desde_entorno()
+    
+    compartido = EstadoCompartido.crear()
+    if compartido is None:
+        return
+    
+    print("[INFO] Iniciando sistema de alertas...")
+    SistemaAlertas.iniciar()
+    
+    lector = LectorSerial()
+    lector.publicador = compartido
+    hilo_serial = threading.Thread(target=lector.leer_continuo, name="lector-serial", daemon=True)
+    hilo_serial.start()
+    
+    if red:
+        servidor = ServidorIngesta()
+        servidor.publicador = compartido
+        servidor.iniciar_en_hilo()
+    
+    try:
+        # Publicación periódica para reflejar cambios de conexión y mantener vigente el estado
+        while not (detener and detener.is_set()):
+            compartido.publicar()
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        compartido.cerrar()
+        SistemaAlertas.limitador.sincronizar()
+
+# =============================
+# DIAGNÓSTICO
+# =============================
+class Diagnostico:
+    """Perfilador por muestreo, instantáneas de memoria y CPU por hilo.
+    
+    No hace nada hasta que se activa: sin hilos, sin tracemalloc y sin
+    ganchos en el camino de lectura.
+    """
+    pid_activo = None
+    pid_perfilado = None  # el perfil de GAS_PERFILAR se lanza una sola vez por proceso
+    detener = None  # Event del hilo de reportes
+    snapshot_anterior = None
+    cpu_anterior = {}
+    lock = threading.Lock()
+    
+    @staticmethod
+    def activo():
+        return Diagnostico.pid_activo == os.getpid()
+    
+    @staticmethod
+    def activar(reportes=False):
+        """Inicia tracemalloc y, opcionalmente, los reportes periódicos en consola"""
+        with Diagnostico.lock:
+            if Diagnostico.activo():
+                return
+            Diagnostico.pid_activo = os.getpid()
+            Diagnostico.snapshot_anterior = None
+            Diagnostico.cpu_anterior = {}
+            detener = Diagnostico.detener = threading.Event()
+        
+        tracemalloc.start(Config.DIAGNOSTICO_MARCOS)
+        print(f"[DIAG] Modo diagnóstico activado (pid {os.getpid()})")
+        
+        if reportes:
+            def bucle():
+                while not detener.wait(Config.DIAGNOSTICO_INTERVALO):
+                    print(Diagnostico.cpu_por_hilo())
+                    print(Diagnostico.memoria(activar=False))
+            
+            threading.Thread(target=bucle, name="diagnostico", daemon=True).start()
+    
+    @staticmethod
+    def desactivar():
+        """Detiene tracemalloc y los reportes periódicos"""
+        with Diagnostico.lock:
+            if not Diagnostico.activo():
+                return
+            Diagnostico.pid_activo = None
+            Diagnostico.snapshot_anterior = None
+            Diagnostico.detener.set()
+        
+        tracemalloc.stop()
+        print("[DIAG] Modo diagnóstico desactivado")
+    
+    @staticmethod
+    def iniciar_desde_entorno():
+        """Activa el modo según GAS_DIAGNOSTICO y perfila según GAS_PERFILAR (segundos).
+        
+        Son independientes: GAS_PERFILAR solo no inicia tracemalloc.
+        """
+        if os.environ.get("GAS_DIAGNOSTICO") == "1":
+            Diagnostico.activar(reportes=True)
+        
+        try:
+            segundos = float(os.environ.get("GAS_PERFILAR") or 0)
+        except ValueError:
+            print(f"[ERROR] GAS_PERFILAR debe ser un número de segundos: {os.environ['GAS_PERFILAR']!r}")
+            return
+        if segundos > 0 and Diagnostico.pid_perfilado != os.getpid():
+            Diagnostico.pid_perfilado = os.getpid()
+            Diagnostico.perfilar_async(segundos)
+    
+    @staticmethod
+    def perfilar(segundos):
+        """Muestrea las pilas de todos los hilos y las pondera por el CPU que consumió cada hilo.
+        
+        Si tracemalloc está activo lo pausa mientras dura el perfil, para no
+        distorsionar el resultado, y lo reanuda al terminar.
+        """
+        pausado = tracemalloc.is_tracing()
+        if pausado:
+            tracemalloc.stop()
+            print("[DIAG] tracemalloc en pausa durante el perfil")
+        try:
+            return Diagnostico.muestrear(segundos)
+        finally:
+            if pausado and Diagnostico.activo() and not tracemalloc.is_tracing():
+                # Las trazas anteriores se perdieron al detenerlo: el próximo reporte parte de cero
+                with Diagnostico.lock:
+                    Diagnostico.snapshot_anterior = None
+                tracemalloc.start(Config.DIAGNOSTICO_MARCOS)
+    
+    @staticmethod
+    def muestrear(segundos):
+        """Cuerpo del perfilador; ver perfilar"""
+        propio = threading.get_ident()
+        nombres = {}
+        pilas = Counter()  # (ident, pila) -> muestras
+        muestras_hilo = Counter()
+        muestras = 0
+        
+        print(f"[DIAG] Perfilando todos los hilos durante {segundos:g}s...")
+        cpu_inicio = Diagnostico.tiempos_cpu()
+        inicio = time.perf_counter()
+        fin = inicio + segundos
+        
+        while time.perf_counter() < fin:
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                if ident not in nombres:
+                    nombres = {t.ident: t.name for t in threading.enumerate()}
+                
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                pilas[(ident, tuple(reversed(pila)))] += 1
+                muestras_hilo[ident] += 1
+            muestras += 1
+            time.sleep(Config.DIAGNOSTICO_MUESTREO)
+        
+        transcurrido = time.perf_counter() - inicio
+        cpu_fin = Diagnostico.tiempos_cpu()
+        
+        # Peso de cada muestra: segundos de CPU del hilo repartidos entre sus muestras.
+        # Los hilos que solo esperan (sleep, readline, wait) quedan con peso cero.
+        if cpu_inicio is not None and cpu_fin is not None:
+            unidad = "CPU"
+            cpu_hilo = {
+                ident: max(0.0, cpu_fin[ident][1] - cpu_inicio.get(ident, (None, 0.0))[1])
+                for ident in muestras_hilo if ident in cpu_fin
+            }
+            peso = {ident: cpu_hilo.get(ident, 0.0) / cuenta for ident, cuenta in muestras_hilo.items()}
+        else:
+            unidad = "reloj, incluye esperas"
+            cpu_hilo = None
+            peso = {ident: transcurrido / max(muestras, 1) for ident in muestras_hilo}
+        
+        ponderadas = Counter()
+        for (ident, pila), cuenta in pilas.items():
+            segundos_pila = cuenta * peso[ident]
+            if segundos_pila > 0:
+                ponderadas[pila] += segundos_pila
+        
+        os.makedirs(Config.DIAGNOSTICO_DIR, exist_ok=True)
+        marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ruta = os.path.join(Config.DIAGNOSTICO_DIR, f"perfil_{marca}_{os.getpid()}.txt")
+        
+        # Formato de pilas colapsadas (compatible con flamegraph.pl / speedscope), en microsegundos
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            for pila, segundos_pila in ponderadas.most_common():
+                microsegundos = round(segundos_pila * 1e6)
+                if microsegundos:
+                    archivo.write(";".join(pila) + f" {microsegundos}\n")
+        
+        por_funcion = Counter()
+        for pila, segundos_pila in ponderadas.items():
+            if len(pila) > 1:
+                por_funcion[(pila[0], pila[-1])] += segundos_pila
+        
+        lineas = [f"[DIAG] Perfil de {muestras} muestras en {transcurrido:.1f}s ({unidad}) guardado en {ruta}"]
+        if cpu_hilo is not None:
+            for ident, cpu in sorted(cpu_hilo.items(), key=lambda t: -t[1]):
+                lineas.append(f"  {nombres.get(ident, ident)}: {cpu:.2f}s CPU ({100 * cpu / transcurrido:.0f}% de un núcleo)")
+        lineas.append("  Funciones con más tiempo en la cima de la pila:")
+        for (hilo, funcion), segundos_funcion in por_funcion.most_common(15):
+            lineas.append(f"    {1000 * segundos_funcion:8.1f} ms  [{hilo}] {funcion}")
+        
+        resumen = "\n".join(lineas)
+        print(resumen)
+        return resumen
+    
+    @staticmethod
+    def perfilar_async(segundos, al_terminar=None):
+        """Ejecuta el perfilador en un hilo; al_terminar recibe el resumen"""
+        def ejecutar():
+            resumen = Diagnostico.perfilar(segundos)
+            if al_terminar:
+                al_terminar(resumen)
+        
+        hilo = threading.Thread(target=ejecutar, name="perfilador", daemon=True)
+        hilo.start()
+        return hilo
+    
+    @staticmethod
+    def memoria(limite=10, activar=True):
+        """Toma una instantánea de tracemalloc y la compara con la anterior"""
+        if activar:
+            Diagnostico.activar()
+        if not tracemalloc.is_tracing():
+            return "[DIAG] tracemalloc desactivado o en pausa por el perfilador"
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        actual, pico = tracemalloc.get_traced_memory()
+        lineas = [f"[DIAG] Memoria trazada: {actual / 1024:.0f} KiB (pico {pico / 1024:.0f} KiB)"]
+        
+        with Diagnostico.lock:
+            anterior = Diagnostico.snapshot_anterior
+            Diagnostico.snapshot_anterior = snapshot
+        
+        if anterior is None:
+            lineas.append("  Primera instantánea; las siguientes mostrarán la diferencia")
+            estadisticas = snapshot.statistics("lineno")[:limite]
+        else:
+            estadisticas = snapshot.compare_to(anterior, "lineno")[:limite]
+        
+        for estadistica in estadisticas:
+            lineas.append(f"  {estadistica}")
+        return "\n".join(lineas)
+    
+    @staticmethod
+    def tiempos_cpu():
+        """Devuelve {ident: (nombre_hilo, segundos de CPU)}, o None si el sistema no lo permite"""
+        hilos = threading.enumerate()
+        
+        if psutil:
+            por_id = {t.id: t.user_time + t.system_time for t in psutil.Process().threads()}
+            return {h.ident: (h.name, por_id[h.native_id]) for h in hilos if h.native_id in por_id}
+        
+        if hasattr(time, "pthread_getcpuclockid"):
+            tiempos = {}
+            for hilo in hilos:
+                try:
+                    tiempos[hilo.ident] = (hilo.name, time.clock_gettime(time.pthread_getcpuclockid(hilo.ident)))
+                except (OSError, TypeError):
+                    pass
+            return tiempos
+        
+        return None
+    
+    @staticmethod
+    def cpu_por_hilo():
+        """Resume el CPU acumulado por hilo y el consumido desde el reporte anterior"""
+        tiempos = Diagnostico.tiempos_cpu()
+        if tiempos is None:
+            return "[DIAG] CPU por hilo no disponible (instale psutil)"
+        
+        with Diagnostico.lock:
+            anterior = Diagnostico.cpu_anterior
+            Diagnostico.cpu_anterior = tiempos
+        
+        lineas = ["[DIAG] CPU por hilo (total / desde el reporte anterior):"]
+        for ident, (nombre, segundos) in sorted(tiempos.items(), key=lambda t: -t[1][1]):
+            delta = segundos - anterior.get(ident, (nombre, 0))[1]
+            lineas.append(f"  {nombre:<28} {segundos:8.2f}s  {delta:+8.2f}s")
+        return "\n".join(lineas)
+
 # =============================
 # INTERFAZ GRÁFICA MEJORADA
 # =============================
 class InterfazModerna:
-    def __init__(self, root):
+    def __init__(self, root, estado_compartido=None):
         self.root = root
+        self.estado_compartido = estado_compartido
         self.configurar_ventana()
         self.crear_widgets()
         self.iniciar_actualizacion()
+        
+        # Atajo oculto para el modo diagnóstico
+        self.root.bind("<Control-Shift-D>", lambda e: self.ventana_diagnostico())
+        self.root.bind("<Control-Shift-d>", lambda e: self.ventana_diagnostico())
     
     def configurar_ventana(self):
         """Configura la ventana principal"""
         self.root.title("🔥 Monitor de Gas MQ2 - ESP32")
-        self.root.geometry("600x700")
+        # El monitor conectado a memoria compartida agrega la gráfica de tendencia
+        self.root.geometry("600x820" if self.estado_compartido else "600x700")
         self.root.resizable(False, False)
         
         # Estilos
@@ -539,13 +1892,33 @@ class InterfazModerna:
         
         self.label_alertas = tk.Label(
             stats_inner,
-            text="Alertas enviadas hoy: 0",
+            text="Avisos recientes: 0",
             font=("Arial", 11),
             bg=self.color_panel,
             anchor=tk.W
         )
         self.label_alertas.pack(fill=tk.X, pady=5)
         
+        # Tendencia a partir del anillo de muestras compartido
+        if self.estado_compartido:
+            self.label_tendencia = tk.Label(
+                stats_inner,
+                text="Tendencia: ---",
+                font=("Arial", 11),
+                bg=self.color_panel,
+                anchor=tk.W
+            )
+            self.label_tendencia.pack(fill=tk.X, pady=5)
+            
+            self.canvas_tendencia = tk.Canvas(
+                stats_inner,
+                height=100,
+                bg="#fdfefe",
+                highlightthickness=1,
+                highlightbackground="#bdc3c7"
+            )
+            self.canvas_tendencia.pack(fill=tk.X, pady=5)
+        
         # ===== PIE DE PÁGINA =====
         footer = tk.Label(
             self.root,
@@ -558,6 +1931,9 @@ class InterfazModerna:
     
     def actualizar_interfaz(self):
         """Actualiza los elementos de la interfaz"""
+        if self.estado_compartido:
+            self.estado_compartido.volcar_en_estado()
+        
         with Estado.lock:
             # Estado del gas
             if Estado.gas_detectado:
@@ -592,7 +1968,46 @@ class InterfazModerna:
         self.label_usuarios.config(text=f"Usuarios registrados: {len(usuarios)}")
         
         total_alertas = sum(u[2] for u in usuarios)
-        self.label_alertas.config(text=f"Alertas enviadas: {total_alertas}")
+        self.label_alertas.config(text=f"Avisos recientes: {total_alertas}")
+        
+        if self.estado_compartido:
+            self.dibujar_tendencia()
+    
+    def dibujar_tendencia(self):
+        """Grafica las últimas muestras del anillo compartido junto al umbral"""
+        muestras = self.estado_compartido.muestras_recientes(Config.TENDENCIA_MUESTRAS)
+        canvas = self.canvas_tendencia
+        canvas.delete("all")
+        
+        if not muestras:
+            self.label_tendencia.config(text="Tendencia: sin muestras")
+            return
+        
+        valores = [ao for _, ao, _ in muestras]
+        self.label_tendencia.config(
+            text=f"Últimas {len(valores)} muestras: mín {min(valores)} | "
+                 f"prom {sum(valores) // len(valores)} | máx {max(valores)}"
+        )
+        
+        ancho = canvas.winfo_width()
+        alto = canvas.winfo_height()
+        if ancho <= 1:
+            return
+        
+        escala = max(4095, max(valores), Config.UMBRAL_ANALOGICO)
+        def y(valor):
+            return alto - 4 - (alto - 8) * valor / escala
+        
+        y_umbral = y(Config.UMBRAL_ANALOGICO)
+        canvas.create_line(0, y_umbral, ancho, y_umbral, fill=self.color_alerta, dash=(4, 2))
+        
+        if len(valores) > 1:
+            paso = ancho / (Config.TENDENCIA_MUESTRAS - 1)
+            inicio = ancho - paso * (len(valores) - 1)
+            puntos = []
+            for i, valor in enumerate(valores):
+                puntos.extend((inicio + i * paso, y(valor)))
+            canvas.create_line(*puntos, fill="#2980b9", width=2)
     
     def iniciar_actualizacion(self):
         """Inicia el ciclo de actualización automática"""
@@ -685,7 +2100,7 @@ class InterfazModerna:
         
         tree.heading("id", text="ID")
         tree.heading("correo", text="Correo Electrónico")
-        tree.heading("enviados", text="Alertas Enviadas")
+        tree.heading("enviados", text="Avisos Recientes")
         
         tree.column("id", width=80, anchor=tk.CENTER)
         tree.column("correo", width=350)
@@ -747,6 +2162,56 @@ class InterfazModerna:
         for user_id, correo, enviados in usuarios:
             tree.insert("", "end", values=(user_id, correo, enviados))
     
+    def ventana_diagnostico(self):
+        """Ventana oculta de diagnóstico (Ctrl+Shift+D)"""
+        win = tk.Toplevel(self.root)
+        win.title("Diagnóstico")
+        win.geometry("760x480")
+        win.configure(bg=self.color_panel)
+        
+        salida = tk.Text(win, font=("Consolas", 9), wrap=tk.NONE)
+        
+        def mostrar(texto):
+            salida.insert(tk.END, texto + "\n\n")
+            salida.see(tk.END)
+        
+        def perfilar():
+            # El perfilador corre en otro hilo; el resultado vuelve al hilo de Tk con after
+            resultado = []
+            Diagnostico.perfilar_async(10, resultado.append)
+            mostrar("[DIAG] Perfilando 10 s...")
+            
+            def esperar():
+                if not win.winfo_exists():
+                    return
+                if resultado:
+                    mostrar(resultado[0])
+                else:
+                    win.after(200, esperar)
+            win.after(200, esperar)
+        
+        frame_btn = tk.Frame(win, bg=self.color_panel)
+        frame_btn.pack(pady=10)
+        
+        botones = (
+            ("Perfilar 10 s", perfilar),
+            ("Memoria (diferencia)", lambda: mostrar(Diagnostico.memoria())),
+            ("CPU por hilo", lambda: mostrar(Diagnostico.cpu_por_hilo())),
+            ("Desactivar", Diagnostico.desactivar),
+        )
+        for texto, comando in botones:
+            tk.Button(
+                frame_btn,
+                text=texto,
+                command=comando,
+                bg="#34495e",
+                fg="white",
+                font=("Arial", 10),
+                width=18
+            ).pack(side=tk.LEFT, padx=5)
+        
+        salida.pack(padx=10, pady=(0, 10), fill=tk.BOTH, expand=True)
+    
     def ventana_historial(self):
         """Ventana para ver historial de eventos"""
         messagebox.showinfo(
@@ -759,9 +2224,10 @@ class InterfazModerna:
         """Reinicia los contadores de alertas"""
         if messagebox.askyesno(
             "Confirmar",
-            "¿Reiniciar contadores de alertas enviadas?"
+            "¿Reiniciar contadores de avisos recientes?"
         ):
             if BaseDatos.reiniciar_contadores():
+                SistemaAlertas.limitador.reiniciar()
                 messagebox.showinfo("Éxito", "Contadores reiniciados")
                 self.actualizar_interfaz()
             else:
@@ -771,29 +2237,111 @@ class InterfazModerna:
 # INICIO DEL SISTEMA
 # =============================
 def main():
+    parser = argparse.ArgumentParser(description="Sistema de Monitoreo de Gas")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--multiproceso", action="store_true",
+                      help="ejecuta lectura, detección y alertas en un proceso separado de la interfaz")
+    modo.add_argument("--ingesta", action="store_true",
+                      help="solo lectura, detección y alertas, sin interfaz")
+    modo.add_argument("--monitor", action="store_true",
+                      help="solo interfaz, conectada a una ingesta en ejecución")
+    modo.add_argument("--generar-carga", type=int, metavar="NODOS",
+                      help="simula NODOS nodos ESP32 contra el servidor de red y mide muestras/s")
+    parser.add_argument("--red", action="store_true",
+                        help="además acepta lecturas de nodos ESP32 por TCP/UDP")
+    parser.add_argument("--duracion", type=float, default=10,
+                        help="segundos de la prueba de carga (por defecto 10)")
+    parser.add_argument("--intervalo", type=float, default=0.05,
+                        help="segundos entre lecturas de cada nodo simulado (por defecto 0.05; "
+                             "0 = tan rápido como se pueda, para medir la tasa máxima sostenida)")
+    parser.add_argument("--udp", action="store_true",
+                        help="la prueba de carga envía lotes por UDP en lugar de TCP")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="servidor destino de la prueba de carga")
+    parser.add_argument("--diagnostico", action="store_true",
+                        help="activa tracemalloc y reportes periódicos de CPU y memoria")
+    parser.add_argument("--perfilar", type=float, metavar="SEGUNDOS",
+                        help="perfila todos los hilos al iniciar, sin tracemalloc")
+    args = parser.parse_args()
+    
+    # Por entorno para que también lo vea el proceso de ingesta
+    if args.diagnostico:
+        os.environ["GAS_DIAGNOSTICO"] = "1"
+    if args.perfilar:
+        os.environ["GAS_PERFILAR"] = str(args.perfilar)
+    Diagnostico.iniciar_desde_entorno()
+    
+    if args.generar_carga:
+        GeneradorCarga(
+            args.generar_carga,
+            duracion=args.duracion,
+            intervalo=args.intervalo,
+            host=args.host,
+            udp=args.udp
+        ).ejecutar()
+        return
+    
     print("=" * 50)
     print(" Sistema de Monitoreo de Gas - Versión 2.0")
     print("=" * 50)
     
-    # Reiniciar contadores al inicio
-    print("[INFO] Reiniciando contadores...")
-    BaseDatos.reiniciar_contadores()
+    if args.ingesta:
+        print("[INFO] Iniciando proceso de ingesta...")
+        proceso_ingesta(red=args.red)
+        return
     
-    # Iniciar lector serial
-    print("[INFO] Iniciando lector serial...")
-    lector = LectorSerial()
-    hilo_serial = threading.Thread(target=lector.leer_continuo, daemon=True)
-    hilo_serial.start()
+    compartido = None
+    proceso = None
+    detener = None
+    
+    if args.multiproceso:
+        if EstadoCompartido.en_uso():
+            print(f"[ERROR] Ya hay una ingesta publicando en '{Config.SHM_NOMBRE}'; use --monitor")
+            return
+        print("[INFO] Iniciando proceso de ingesta...")
+        detener = multiprocessing.Event()
+        proceso = multiprocessing.Process(target=proceso_ingesta, args=(detener, args.red), daemon=True)
+        proceso.start()
+        compartido = EstadoCompartido.adjuntar()
+    elif args.monitor:
+        compartido = EstadoCompartido.adjuntar(rastrear=False)
+    else:
+        print("[INFO] Iniciando sistema de alertas...")
+        SistemaAlertas.iniciar()
+        
+        # Iniciar lector serial
+        print("[INFO] Iniciando lector serial...")
+        lector = LectorSerial()
+        hilo_serial = threading.Thread(target=lector.leer_continuo, name="lector-serial", daemon=True)
+        hilo_serial.start()
+        
+        if args.red:
+            print("[INFO] Iniciando servidor de red...")
+            ServidorIngesta().iniciar_en_hilo()
+    
+    if (args.multiproceso or args.monitor) and compartido is None:
+        if detener:
+            detener.set()
+        return
     
     # Iniciar interfaz
     print("[INFO] Iniciando interfaz gráfica...")
     root = tk.Tk()
-    app = InterfazModerna(root)
+    app = InterfazModerna(root, compartido)
     
     print("[✓] Sistema iniciado correctamente")
     print("=" * 50)
     
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        if compartido:
+            compartido.cerrar()
+        elif not args.monitor:
+            SistemaAlertas.limitador.sincronizar()
+        if proceso:
+            detener.set()
+            proceso.join(timeout=3)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file